@@ -1,5 +1,6 @@
 """Unitree G1 composer class."""
 
+import logging
 from dataclasses import dataclass
 from typing import Dict, Optional, Sequence, Tuple
 
@@ -9,6 +10,8 @@ from dm_control.composer.observation import observable
 from dm_env import specs
 from mujoco_utils import mjcf_utils, physics_utils, spec_utils, types
 
+log = logging.getLogger(__name__)
+
 
 @dataclass(frozen=True)
 class Dof:
@@ -64,6 +67,10 @@ _G1_DOFS: Dict[str, Dof] = {
 class G1Entity(composer.Entity):
     """A Unitree G1 robot entity."""
 
+    # Preprocessed model XML paths, keyed by source path. The preprocessed file only
+    # depends on the source file, so it is written once per process.
+    _preprocessed_model_paths: Dict[str, str] = {}
+
     def __init__(self, model_path):
         """Initialize G1Entity.
 
@@ -73,64 +80,78 @@ class G1Entity(composer.Entity):
         self._model_path = model_path
         self._attached = []
         
-        # Fix the XML file by removing keyframes and fixing mesh paths
-        import tempfile
-        import xml.etree.ElementTree as ET
-        import os
-        
         try:
-            tree = ET.parse(model_path)
-            root = tree.getroot()
-            
-            # Find the compiler element and update meshdir to absolute path
-            original_dir = os.path.dirname(model_path)
-            assets_dir = os.path.join(original_dir, "assets")
-            compilers = root.findall(".//compiler")
-            
-            modifications_made = False
-            
-            if compilers:
-                for compiler in compilers:
-                    if 'meshdir' in compiler.attrib:
-                        compiler.attrib['meshdir'] = assets_dir
-                        modifications_made = True
-            
-            # Find and remove all keyframe elements
-            keyframes = root.findall(".//keyframe")
-            if keyframes:
-                for keyframe in keyframes:
-                    parent_map = {c: p for p in tree.iter() for c in p}
-                    if keyframe in parent_map:
-                        parent_map[keyframe].remove(keyframe)
-                        modifications_made = True
-            
-            # Find and remove all freejoint elements
-            freejoints = root.findall(".//freejoint")
-            if freejoints:
-                for freejoint in freejoints:
-                    parent_map = {c: p for p in tree.iter() for c in p}
-                    if freejoint in parent_map:
-                        parent_map[freejoint].remove(freejoint)
-                        modifications_made = True
-            
-            if modifications_made:
-                with tempfile.NamedTemporaryFile(suffix='.xml', delete=False) as tmp_file:
-                    tmp_path = tmp_file.name
-                    tree.write(tmp_path)
-                    self._model_path = tmp_path
-            else:
-                print("No modifications needed to the G1 model file")
+            self._model_path = self._preprocess_model(model_path)
                 
             # Load the MJCF model here
             self._mjcf_root = mjcf.from_path(self._model_path)
             
         except Exception as e:
-            print(f"Error preprocessing G1 model XML: {e}")
+            log.error("Error preprocessing G1 model XML: %s", e)
             raise
 
         # Now call the parent constructor
         super().__init__()
 
+    @classmethod
+    def _preprocess_model(cls, model_path: str) -> str:
+        """Returns the path of a copy of the model without keyframes or freejoints.
+
+        Mesh paths are also made absolute. The result is cached per `model_path`.
+        """
+        if model_path in cls._preprocessed_model_paths:
+            return cls._preprocessed_model_paths[model_path]
+
+        # Fix the XML file by removing keyframes and fixing mesh paths
+        import tempfile
+        import xml.etree.ElementTree as ET
+        import os
+        
+        tree = ET.parse(model_path)
+        root = tree.getroot()
+        
+        # Find the compiler element and update meshdir to absolute path
+        original_dir = os.path.dirname(model_path)
+        assets_dir = os.path.join(original_dir, "assets")
+        compilers = root.findall(".//compiler")
+        
+        modifications_made = False
+        
+        if compilers:
+            for compiler in compilers:
+                if 'meshdir' in compiler.attrib:
+                    compiler.attrib['meshdir'] = assets_dir
+                    modifications_made = True
+        
+        # Find and remove all keyframe elements
+        keyframes = root.findall(".//keyframe")
+        if keyframes:
+            for keyframe in keyframes:
+                parent_map = {c: p for p in tree.iter() for c in p}
+                if keyframe in parent_map:
+                    parent_map[keyframe].remove(keyframe)
+                    modifications_made = True
+        
+        # Find and remove all freejoint elements
+        freejoints = root.findall(".//freejoint")
+        if freejoints:
+            for freejoint in freejoints:
+                parent_map = {c: p for p in tree.iter() for c in p}
+                if freejoint in parent_map:
+                    parent_map[freejoint].remove(freejoint)
+                    modifications_made = True
+        
+        preprocessed_path = model_path
+        if modifications_made:
+            with tempfile.NamedTemporaryFile(suffix='.xml', delete=False) as tmp_file:
+                preprocessed_path = tmp_file.name
+                tree.write(preprocessed_path)
+        else:
+            log.debug("No modifications needed to the G1 model file")
+
+        cls._preprocessed_model_paths[model_path] = preprocessed_path
+        return preprocessed_path
+
     def _build(self, name: Optional[str] = None) -> None:
         """Initializes a G1Entity.
 
@@ -1,40 +1,57 @@
 """A task where two shadow hands must play a given MIDI file on a piano."""
 
-from typing import List, Optional, Sequence, Tuple
+import logging
+import math
+from typing import Optional, Sequence, Tuple
 
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 from dm_control import mjcf
 from dm_control.composer import variation as base_variation
 from dm_control.composer.observation import observable
-from dm_control.mjcf import commit_defaults
-from dm_control.utils.rewards import tolerance
 from dm_env import specs
-from mujoco_utils import collision_utils, spec_utils
+from mujoco_utils import spec_utils
 
 import mink  # Add mink import
 import mujoco
 
 import robopianist.models.hands.shadow_hand_constants as hand_consts
+from robopianist.models.hands import HandSide
 from robopianist.models.arenas import stage
 from robopianist.music import midi_file
 from robopianist.suite import composite_reward
 from robopianist.suite.tasks import base
 from robopianist.suite.tasks.piano_with_shadow_hands import PianoWithShadowHands
-from loop_rate_limiters import RateLimiter
 
 from wrappers.models.g1_entity import G1Entity
 
+log = logging.getLogger(__name__)
+
 # Distance thresholds for the shaping reward.
 _FINGER_CLOSE_ENOUGH_TO_KEY = 0.01
 _KEY_CLOSE_ENOUGH_TO_PRESSED = 0.05
 
+# Scale of dm_control's gaussian sigmoid at its default `value_at_margin` of 0.1.
+_GAUSSIAN_SCALE = np.sqrt(-2 * np.log(0.1))
+
 # Energy penalty coefficient.
 _ENERGY_PENALTY_COEF = 5e-3
 
+# Contact distance below which the forearms are considered to be colliding.
+_FOREARM_COLLISION_MARGIN = 1e-8
+
 # Transparency of fingertip geoms.
 _FINGERTIP_ALPHA = 1.0
 
+# Fingertip colors with the above transparency, indexed by finger.
+_FINGERTIP_RGBA = tuple(
+    color + (_FINGERTIP_ALPHA,) for color in hand_consts.FINGERTIP_COLORS
+)
+
+# Row of each (hand, finger) fingertip in the fingertip bindings, which list the
+# left hand first. Hands are ordered right then left, as in the fingering state.
+_FINGERTIP_ROWS = np.array([[5, 6, 7, 8, 9], [0, 1, 2, 3, 4]])
+
 # Bounds for the uniform distribution from which initial hand offset is sampled.
 _POSITION_OFFSET = 0.05
 
@@ -45,37 +62,222 @@ _HEIGHT_OFFSET = 0.76
 _LEFT_HAND_POSITION = (0.4, -0.15, 0.13 + _HEIGHT_OFFSET)  # Original z=0.13
 _RIGHT_HAND_POSITION = (0.4, 0.15, 0.13 + _HEIGHT_OFFSET)  # Original z=0.13
 
+# Moves the IK target from the shadow hand's forearm root to the approximate wrist
+# position. The shadow hand's forearm is about 0.1m long.
+_FOREARM_TO_WRIST_OFFSET = np.array([0.1, 0.0, 0.0])
+
+# G1 joints driven by the scripted waist and right leg motion in `before_step`,
+# in the order their controls are written.
+_G1_WAIST_JOINTS = ('waist_pitch_joint', 'waist_roll_joint', 'waist_yaw_joint')
+_G1_RIGHT_LEG_JOINTS = (
+    'right_hip_pitch_joint',
+    'right_knee_joint',
+    'right_ankle_pitch_joint',
+    'right_hip_roll_joint',
+    'right_hip_yaw_joint',
+    'right_ankle_roll_joint',
+)
+
+# The G1 wrist IK targets sit 0.2m behind the shadow hand wrists.
+_WRIST_TO_G1_TARGET_OFFSET = np.array([-0.2, 0.0, 0.0])
+
+# G1 wrist IK weights, shared by the damped least-squares step and the mink fallback.
+_IK_POSITION_COST = 500.0
+_IK_LM_DAMPING = 20.0  # Scaled by the squared weighted task error.
+_IK_DAMPING = 20.0
+
 import os
 
+# The G1 model shipped with this repo.
+_G1_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "assets/unitree_g1/g1_modified.xml"
+)
+
+
+def _euler_to_quat(
+    roll: float, pitch: float, yaw: float
+) -> Tuple[float, float, float, float]:
+    """Convert euler angles in degrees to a (w, x, y, z) quaternion."""
+    # Convert to radians
+    roll, pitch, yaw = math.radians(roll), math.radians(pitch), math.radians(yaw)
+    
+    # Compute quaternion components
+    cr, cp, cy = math.cos(roll/2), math.cos(pitch/2), math.cos(yaw/2)
+    sr, sp, sy = math.sin(roll/2), math.sin(pitch/2), math.sin(yaw/2)
+    
+    w = cr * cp * cy + sr * sp * sy
+    x = sr * cp * cy - cr * sp * sy
+    y = cr * sp * cy + sr * cp * sy
+    z = cr * cp * sy - sr * sp * cy
+    
+    return (w, x, y, z)
+
+
+def _gaussian_tolerance(x, upper: float, margin: float) -> np.ndarray:
+    """dm_control's gaussian `tolerance` with `bounds=(0, upper)`.
+
+    Gives the same values as `dm_control.utils.rewards.tolerance`, but skips its
+    argument validation and sigmoid dispatch, which would otherwise run on every
+    step since the rewards call it with fixed arguments.
+    """
+    in_bounds = np.logical_and(0.0 <= x, x <= upper)
+    d = np.where(x < 0.0, -x, x - upper) / margin
+    return np.where(in_bounds, 1.0, np.exp(-0.5 * (d * _GAUSSIAN_SCALE) ** 2))
+
+
+def _gaussian_tolerance_mean(x: np.ndarray, upper: float, margin: float) -> float:
+    """Mean of `_gaussian_tolerance(x, upper, margin)` over a non-empty `x`.
+
+    In-bounds values have a zero distance to the bounds, for which the gaussian
+    is exactly 1, so a single clipped distance array is transformed in place
+    instead of building the masks and branches of the elementwise version.
+    """
+    d = np.maximum(x - upper, -x)
+    np.maximum(d, 0.0, out=d)
+    d /= margin
+    d *= _GAUSSIAN_SCALE
+    np.square(d, out=d)
+    d *= -0.5
+    np.exp(d, out=d)
+    return float(d.mean())
+
+
+def _pairwise_distances(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Euclidean distances between the rows of `x` (N, 3) and `y` (M, 3).
+
+    Uses |x - y|^2 = |x|^2 + |y|^2 - 2 x.y so the cross term is a single matmul,
+    accumulating in place into the (N, M) result.
+    """
+    dist = x @ y.T
+    dist *= -2.0
+    dist += np.einsum("ij,ij->i", x, x)[:, None]
+    dist += np.einsum("ij,ij->i", y, y)
+    np.maximum(dist, 0.0, out=dist)
+    return np.sqrt(dist, out=dist)
+
+
+def _damped_least_squares(jac: np.ndarray, err: np.ndarray, lam: float) -> np.ndarray:
+    """Batched damped least-squares step `J^T (J J^T + lam I)^-1 e`.
+
+    Args:
+        jac: Task Jacobians of shape (..., m, n).
+        err: Task errors of shape (..., m).
+        lam: Damping added to the diagonal of `J J^T`.
+
+    Returns:
+        Joint displacements of shape (..., n).
+    """
+    jjt = jac @ np.swapaxes(jac, -1, -2)
+    jjt += lam * np.eye(jac.shape[-2])
+    return np.einsum("...mn,...m->...n", jac, np.linalg.solve(jjt, err[..., None])[..., 0])
+
+
+def _geom_contacts(geom, class_contacts: dict) -> Tuple[Optional[int], Optional[int]]:
+    """Returns `geom`'s (contype, conaffinity) with defaults applied.
+
+    Resolves them the way `commit_defaults` does, but without writing them to the
+    geom. The walk up each default class chain is memoized in `class_contacts`, so
+    geoms that share a class don't repeat it.
+    """
+    dclass = geom.dclass
+    parent = geom.parent
+    while dclass is None and parent != geom.root:
+        dclass = getattr(parent, 'childclass', None)
+        parent = parent.parent
+    if dclass is None:
+        dclass = geom.root.default
+
+    if dclass not in class_contacts:
+        contype = conaffinity = None
+        cls = dclass
+        while cls != geom.root:
+            if contype is None:
+                contype = cls.geom.contype
+            if conaffinity is None:
+                conaffinity = cls.geom.conaffinity
+            cls = cls.parent
+        class_contacts[dclass] = (contype, conaffinity)
+    default_contype, default_conaffinity = class_contacts[dclass]
+
+    contype = default_contype if geom.contype is None else geom.contype
+    conaffinity = default_conaffinity if geom.conaffinity is None else geom.conaffinity
+    return contype, conaffinity
+
+
+# Camera orientations, looking horizontally at build time and tilted at each reset.
+_CAM_INITIAL_QUAT = _euler_to_quat(0, 0, 0)
+_CAM_EPISODE_QUAT = _euler_to_quat(0, 1.0, 0)
+
+# Pan angle of the camera around the piano at the start of each episode.
+_CAM_INITIAL_ANGLE = 2.2
+
+
 class PianoWithShadowHandsAndG1(PianoWithShadowHands):
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        ik_update_rate: int = 1,
+        freeze_g1_after_init: bool = False,
+        **kwargs,
+    ):
+        """Task constructor.
+
+        Args:
+            ik_update_rate: Number of control steps between G1 arm IK solves. Must be
+                at least 1. To stop solving after the reset, use
+                `freeze_g1_after_init` instead.
+            freeze_g1_after_init: If True, the G1 arms are only solved once in
+                `initialize_episode` and then hold that pose for the rest of the
+                episode. The G1 is cosmetic, so this is safe for RL training.
+            *args, **kwargs: Forwarded to `PianoWithShadowHands`.
+
+        Raises:
+            ValueError: If `ik_update_rate` is less than 1.
+        """
+        if ik_update_rate < 1:
+            raise ValueError(
+                f"ik_update_rate must be at least 1, got {ik_update_rate}. Use "
+                "freeze_g1_after_init=True to stop solving the G1 arms after reset."
+            )
+
         # Store height offset before calling super().__init__
         self._height_offset = _HEIGHT_OFFSET
         
-        # Override the hand positions in the parent class
-        import sys
-        sys.modules['robopianist.suite.tasks.base']._LEFT_HAND_POSITION = _LEFT_HAND_POSITION
-        sys.modules['robopianist.suite.tasks.base']._RIGHT_HAND_POSITION = _RIGHT_HAND_POSITION
-        
         super().__init__(*args, **kwargs)
-        self._camera_angle = 2.2
+        # Key joint ranges are fixed when the piano is built, so normalizing the
+        # key state in the reward is a multiply by this cached reciprocal.
+        self._qpos_range_inv = 1.0 / self.piano._qpos_range[:, 1]
+        # Resolved once so the energy reward doesn't walk the observables each step.
+        self._actuators_power_fns = (
+            self.right_hand.observables.actuators_power,
+            self.left_hand.observables.actuators_power,
+        )
         self._camera_radius = 2.4
         self._camera_height = 1.0
         self._camera_angular_velocity = 0.01
+        # The camera pans at a constant rate, so each step rotates its (cos, sin) by
+        # this fixed angle instead of evaluating trig functions.
+        self._camera_step_cos = math.cos(self._camera_angular_velocity)
+        self._camera_step_sin = math.sin(self._camera_angular_velocity)
         self._camera_zoom_rate = 0.0  # Rate at which camera zooms out
         self._max_camera_radius = 2.4  # Maximum zoom out distance
         self._camera_tilt = 0.4  # Downward tilt angle in radians
         self._target_camera_height = self._camera_height # Final height
+        # Scratch buffers for the per-step camera orientation
+        self._camera_rot_matrix = np.empty((3, 3))
+        self._camera_quat = np.empty(4)
         self._setup_g1_arm_joints()
         self.add_g1()
+        self._find_g1_elements()
         self._disable_collisions_between_hands_and_g1()
         self._setup_camera()
         self._raise_piano()
         
-        # Increase IK update rate (from 5 to 1 - update every timestep)
-        self._ik_update_rate = 1
+        self._ik_update_rate = ik_update_rate
+        # Integration timestep of the mink fallback solve (1000Hz)
+        self._ik_dt = 1.0 / 1000.0
+        self._freeze_g1_after_init = freeze_g1_after_init
         self._ik_counter = 0
-        self._last_velocities = None
         
         # Add movement timing variables
         self._movement_time = 0.0
@@ -84,21 +286,14 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
         self._leg_amplitude = 0.3  # radians for knee and hip pitch
         self._hip_roll_amplitude = 0.0  # radians for hip roll (side-to-side)
 
-    def _euler_to_quat(self, roll, pitch, yaw):
-        """Convert euler angles to quaternion."""
-        # Convert to radians
-        roll, pitch, yaw = np.radians([roll, pitch, yaw])
-        
-        # Compute quaternion components
-        cr, cp, cy = np.cos(roll/2), np.cos(pitch/2), np.cos(yaw/2)
-        sr, sp, sy = np.sin(roll/2), np.sin(pitch/2), np.sin(yaw/2)
-        
-        w = cr * cp * cy + sr * sp * sy
-        x = sr * cp * cy - cr * sp * sy
-        y = cr * sp * cy + sr * cp * sy
-        z = cr * cp * sy - sr * sp * cy
-        
-        return [w, x, y, z]
+    def _add_hand(self, hand_side: HandSide, position, **kwargs):
+        """Attach a shadow hand at the raised position used with the G1."""
+        del position  # Replaced by the raised hand positions.
+        if hand_side == HandSide.LEFT:
+            position = _LEFT_HAND_POSITION
+        else:
+            position = _RIGHT_HAND_POSITION
+        return super()._add_hand(hand_side=hand_side, position=position, **kwargs)
 
     def _setup_camera(self) -> None:
         """Set up the panning camera."""
@@ -106,7 +301,7 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
             'camera',
             name='panning_camera',
             pos=[0, self._camera_radius, self._camera_height],
-            quat=self._euler_to_quat(0, 0, 0),  # Point camera horizontally
+            quat=_CAM_INITIAL_QUAT,  # Point camera horizontally
             mode='fixed'  # Use fixed mode to allow manual control
         )
 
@@ -126,20 +321,15 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
                 euler=[0, 0, 3.14159]  # Rotate 180 degrees around Z axis (in radians)
             )
 
-            dir = "/".join(os.path.dirname(__file__).split("/")[:-1])
-            model_path = os.path.join(dir, "assets/unitree_g1/g1_modified.xml")
-
             # Create and attach G1 entity
-            g1_entity = G1Entity(model_path)
+            g1_entity = G1Entity(_G1_MODEL_PATH)
             self._arena.attach(g1_entity, attachment_site)
             
             # Store G1 entity reference
             self._g1 = g1_entity
             
         except Exception as e:
-            print(f"Error adding G1 to environment: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Error adding G1 to environment: %s", e)
             self._g1 = None
 
     def _initialize_g1_position(self, physics: mjcf.Physics) -> None:
@@ -148,9 +338,7 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
             return
 
         try:
-            # Find the G1's root body
-            root_name = "g1_29dof_rev_1_0/"
-            root_id = physics.model.name2id(root_name, "body")
+            root_id = self._g1_root_body_id
             
             if root_id >= 0:
                 # Position G1 behind and slightly above the piano
@@ -162,12 +350,8 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
                 physics.data.xquat[root_id] = [0, 0, 1, 0]  # 180° around Y axis
                 
                 # Set waist pitch joint to angle head downward
-                waist_pitch_joint = self._g1.mjcf_model.find('joint', 'waist_pitch_joint')
-                if waist_pitch_joint is not None:
-                    # Set to -0.4 radians (about 23 degrees) downward - increased from -0.2
-                    physics.bind(waist_pitch_joint).qpos = -0.4
-                else:
-                    raise ValueError("Warning: Could not find waist pitch joint")
+                # Set to -0.4 radians (about 23 degrees) downward - increased from -0.2
+                self._waist_pitch_binding.qpos = -0.4
                 
                 # Get hand positions for initial arm positioning
                 hand_positions = self._get_shadow_hand_positions(physics)
@@ -175,39 +359,41 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
                 # Update arm positions to match hands
                 self._update_g1_arms(physics, hand_positions)
             else:
-                print(f"Warning: Could not find G1 root body with name {root_name}")
+                log.warning("Could not find G1 root body")
             
         except Exception as e:
-            print(f"Error initializing G1 position: {e}")
-            import traceback
-            traceback.print_exc()
+            log.warning(
+                "Error initializing G1 position: %s", e,
+                exc_info=log.isEnabledFor(logging.DEBUG),
+            )
 
     def initialize_episode(self, physics: mjcf.Physics, random_state: np.random.RandomState) -> None:
         """Initialize episode and raise components."""
         # First call parent's initialize_episode
         super().initialize_episode(physics, random_state)
         
-        # Raise the hands using physics
-        for hand_name, hand in [("right", self.right_hand), ("left", self.left_hand)]:
-            hand_body = physics.bind(hand.root_body)
-            current_pos = hand_body.xpos.copy()
-            new_pos = [current_pos[0], current_pos[1], current_pos[2] + self._height_offset]
-            hand_body.xpos = new_pos
+        # The hands are already attached at the raised height (see `_add_hand`), so
+        # only their positions need to be brought up to date for the G1 arm IK. The
+        # full forward pass runs once when the reset context exits.
+        mujoco.mj_kinematics(physics.model.ptr, physics.data.ptr)
         
-        # Apply changes
-        physics.forward()
-        
-        # Initialize G1 position after hands are positioned
-        self._initialize_g1_position(physics)
+        self._cache_forearm_geoms(physics)
+        self._cache_fingering_ids(physics)
 
-        # Initialize mink configuration if not already done
+        # Initialize mink configuration and cached ids before the first IK solve
         self._initialize_mink(physics)
+
+        # Initialize G1 position after hands are positioned
+        self._initialize_g1_position(physics)
         
         # Reset and update camera
-        self._camera_angle = 2.2
-        camera = physics.bind(self._camera)
+        # The pan angle is only tracked through its (cos, sin), see `after_step`.
+        self._camera_cos = math.cos(_CAM_INITIAL_ANGLE)
+        self._camera_sin = math.sin(_CAM_INITIAL_ANGLE)
+        self._camera_binding = physics.bind(self._camera)
+        camera = self._camera_binding
         camera.pos = [self._camera_radius, 0, self._camera_height]
-        camera.quat = self._euler_to_quat(0, 1.0, 0)
+        camera.quat = _CAM_EPISODE_QUAT
 
     # TODO: the below functions are from piano with shadow hands. 
     def _set_rewards(self) -> None:
@@ -245,21 +431,21 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
         note_traj.add_initial_buffer_time(self._initial_buffer_time)
         self._notes = note_traj.notes
         self._sustains = note_traj.sustains
-
-    def _get_shadow_hand_positions(self, physics: mjcf.Physics) -> dict:
-        """Get the current positions of both shadow hands."""
-        positions = {}
-        
-        # Get palm/forearm positions for both hands using root_body
-        for side, hand in [('left', self.left_hand), ('right', self.right_hand)]:
-            root_pos = physics.bind(hand.root_body).xpos.copy()
-            
-            # Add offset to move target position from forearm to approximate wrist position
-            # The shadow hand's forearm is about 0.1m long, so move the target forward
-            forearm_to_wrist_offset = np.array([0.1, 0, 0])  # Added 10cm forward offset
-            positions[side] = root_pos + forearm_to_wrist_offset
-        
-        return positions
+        self._precompute_goal_and_fingering_states()
+
+    def _get_shadow_hand_positions(self, physics: mjcf.Physics) -> np.ndarray:
+        """Get the current positions of both shadow hands.
+
+        Returns:
+            A (2, 3) array with rows ordered (left, right). It is a buffer that is
+            overwritten on the next call.
+        """
+        del physics  # Unused, the root body binding is cached.
+        return np.add(
+            self._hand_root_bindings.xpos,
+            _FOREARM_TO_WRIST_OFFSET,
+            out=self._hand_pos_buf,
+        )
 
     def _setup_g1_arm_joints(self):
         """Set up the G1 arm joints and IK configuration."""
@@ -308,9 +494,86 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
             f"{prefix}right_wrist_yaw_link"
         ]
 
+        # Model ids and bindings for the joints above. These need a physics
+        # instance, so they are filled in by `_initialize_mink`.
+        self._joint_qpos_adr = None
+        self._arm_dof_adr = None
+        self._wrist_body_ids = None
+        self._arm_actuators = None
+
+    def _find_g1_elements(self) -> None:
+        """Look up the G1 MJCF elements that are driven on every step."""
+        if not hasattr(self, '_g1') or self._g1 is None:
+            return
+
+        # Position actuators are named after the joint they drive
+        actuated_joints = (
+            self._left_arm_joints
+            + self._right_arm_joints
+            + list(_G1_WAIST_JOINTS)
+            + list(_G1_RIGHT_LEG_JOINTS)
+        )
+        self._g1_actuators = {}
+        for joint_name in actuated_joints:
+            actuator = self._g1.mjcf_model.find('actuator', joint_name)
+            if actuator is None:
+                raise ValueError(f"Actuator not found for joint: {joint_name}")
+            self._g1_actuators[joint_name] = actuator
+
+        self._waist_pitch_joint = self._g1.mjcf_model.find('joint', 'waist_pitch_joint')
+
+    def _cache_g1_ids(self, physics: mjcf.Physics) -> None:
+        """Cache name->id lookups and bindings used on every IK step."""
+        prefix = "g1_29dof_rev_1_0/"
+        all_joints = self._left_arm_joints + self._right_arm_joints
+        joint_ids = [physics.model.name2id(prefix + name, "joint") for name in all_joints]
+        self._joint_qpos_adr = np.array(
+            physics.model.jnt_qposadr[joint_ids], dtype=np.int32
+        )
+        # Rows ordered (left, right), like `_wrist_body_ids`
+        self._arm_dof_adr = physics.model.jnt_dofadr[joint_ids].reshape(2, -1)
+        # Rows ordered (left, right), like the hand positions
+        self._wrist_body_ids = np.array([
+            physics.model.name2id(f"{prefix}{side}_wrist_yaw_link", "body")
+            for side in ["left", "right"]
+        ])
+        # Position actuators share the joint names, so one binding covers all arms
+        self._arm_actuators = physics.bind(
+            [self._g1_actuators[name] for name in all_joints]
+        )
+        self._waist_actuators = physics.bind(
+            [self._g1_actuators[name] for name in _G1_WAIST_JOINTS]
+        )
+        self._right_leg_actuators = physics.bind(
+            [self._g1_actuators[name] for name in _G1_RIGHT_LEG_JOINTS]
+        )
+        self._g1_root_body_id = physics.model.name2id(prefix, "body")
+        self._waist_pitch_binding = physics.bind(self._waist_pitch_joint)
+        # Shadow hand roots, rows ordered (left, right), used as IK targets
+        self._hand_root_bindings = physics.bind(
+            [self.left_hand.root_body, self.right_hand.root_body]
+        )
+        self._hand_pos_buf = np.empty((2, 3))
+
     def _initialize_mink(self, physics: mjcf.Physics):
-        """Initialize mink IK solver configuration and tasks."""
-        # Create configuration from model
+        """Initialize mink IK solver configuration and tasks.
+
+        These only depend on the compiled model, so they are reused across episodes
+        unless the physics has been recompiled.
+        """
+        if getattr(self, '_mink_model', None) is physics.model.ptr:
+            return
+        self._mink_model = physics.model.ptr
+
+        # Resolve ids against this physics instance
+        self._cache_g1_ids(physics)
+
+        # Scratch state for the damped least-squares IK step
+        self._ik_data = mujoco.MjData(physics.model.ptr)
+        self._ik_jacp = np.zeros((3, physics.model.nv))
+        self._ik_arm_jac = np.empty((2, 3, len(self._left_arm_joints)))
+
+        # Create configuration from model, used as the IK fallback
         self._mink_config = mink.Configuration(physics.model.ptr)
 
         # Create tasks for both hands with balanced parameters
@@ -319,11 +582,15 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
             task = mink.FrameTask(
                 frame_name=f"g1_29dof_rev_1_0/{hand}",
                 frame_type="body",
-                position_cost=500.0,  # More balanced position cost
+                position_cost=_IK_POSITION_COST,  # More balanced position cost
                 orientation_cost=0.0,  # Still no orientation cost
-                lm_damping=20.0,      # Higher damping for stability
+                lm_damping=_IK_LM_DAMPING,  # Higher damping for stability
             )
             self._mink_tasks.append(task)
+
+        # Target poses, one wxyz_xyz row per task with an identity rotation
+        self._ik_target_buf = np.zeros((len(self._mink_tasks), 7))
+        self._ik_target_buf[:, 0] = 1.0  # w component of quaternion
         
         # Create configuration limits with safety margin
         self._joint_limits = [mink.ConfigurationLimit(
@@ -332,108 +599,129 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
             min_distance_from_limits=0.1  # Standard safety margin
         )]
 
-        # Initialize interpolation state
-        self._target_joint_positions = None
-        self._previous_joint_positions = None
-        self._interpolation_progress = 0
-
-    def _update_g1_arms(self, physics: mjcf.Physics, hand_positions: dict) -> None:
-        """Update G1 arm positions using mink IK solver."""
-        try:
-            # Initialize mink configuration if not already done
-            if not hasattr(self, '_mink_config') or self._mink_config is None:
-                self._initialize_mink(physics)
-            
-            # Create hand mapping with adjusted targets - explicitly create new arrays
-            hand_mapping = {
-                'right': np.array([hand_positions['right'][0] - 0.2, hand_positions['right'][1], hand_positions['right'][2]]),
-                'left': np.array([hand_positions['left'][0] - 0.2, hand_positions['left'][1], hand_positions['left'][2]])
-            }
-            
-            # Get current end effector positions and adjusted targets
-            for side in ['right', 'left']:
-                wrist_body = physics.bind(self._g1.mjcf_model.find('body', f'{side}_wrist_yaw_link'))
-                current_pos = wrist_body.xpos
-                target_pos = hand_mapping[side]  # Use adjusted targets
-                error = np.linalg.norm(target_pos - current_pos)
-
-            # Get current joint positions
-            prefix = "g1_29dof_rev_1_0/"
-            all_joints = self._left_arm_joints + self._right_arm_joints
-            current_q = np.zeros(self._mink_config.nq)
-            
-            for joint_name in all_joints:
-                full_joint_name = prefix + joint_name
-                joint_id = physics.model.name2id(full_joint_name, "joint")
-                if joint_id >= 0:
-                    current_q[joint_id] = physics.data.qpos[joint_id]
-            
-            # Start from current position
-            self._mink_config.update(q=current_q)
-            
-            # Update hand task targets with adjusted positions
-            for i, (task, side) in enumerate(zip(self._mink_tasks, ['right', 'left'])):
-                wxyz_xyz = np.zeros(7)
-                wxyz_xyz[0] = 1.0  # w component of quaternion
-                wxyz_xyz[4:] = hand_mapping[side]  # Use adjusted xyz position
-                target = mink.SE3(wxyz_xyz=wxyz_xyz)
-                task.set_target(target)
-            
-            # Increase rate limiter frequency from 20Hz to 100Hz
-            rate = RateLimiter(frequency=1000.0, warn=False)
-
-            # Solve IK with joint limits
+    def _solve_arm_ik_dls(
+        self, physics: mjcf.Physics, current_q: np.ndarray, wrist_targets: np.ndarray
+    ) -> Optional[np.ndarray]:
+        """Take one damped least-squares IK step for both wrists.
+
+        This is the closed form of the mink problem set up in `_initialize_mink`
+        (position-only wrist tasks, no limits), restricted to the 7 DoFs of each
+        arm: `dq = J^T (J J^T + lambda I)^-1 e`.
+
+        Args:
+            physics: The physics instance.
+            current_q: The full qpos to linearize around.
+            wrist_targets: (2, 3) wrist targets with rows ordered (left, right).
+
+        Returns:
+            Arm joint targets ordered like `_joint_qpos_adr`, or None if the step
+            is not finite.
+        """
+        model, data = physics.model.ptr, self._ik_data
+        data.qpos[:] = current_q
+        mujoco.mj_kinematics(model, data)
+        mujoco.mj_comPos(model, data)
+
+        # Both arms are stacked so a single batched solve handles them
+        errors = wrist_targets - data.xpos[self._wrist_body_ids]
+        for i, body_id in enumerate(self._wrist_body_ids):
+            mujoco.mj_jacBody(model, data, self._ik_jacp, None, body_id)
+            self._ik_arm_jac[i] = self._ik_jacp[:, self._arm_dof_adr[i]]
+
+        # Levenberg-Marquardt damping grows with the weighted task error, as in mink
+        lam = _IK_DAMPING / _IK_POSITION_COST**2 + _IK_LM_DAMPING * float(np.sum(errors**2))
+        dq = _damped_least_squares(self._ik_arm_jac, errors, lam)
+
+        # Rows of `dq` are (left, right), matching the joint order
+        target_q = current_q[self._joint_qpos_adr] + dq.ravel()
+
+        if not np.all(np.isfinite(target_q)):
+            return None
+        return target_q
+
+    def _solve_arm_ik_mink(
+        self, current_q: np.ndarray, wrist_targets: np.ndarray
+    ) -> Optional[np.ndarray]:
+        """Solve the wrist IK with mink's QP solver.
+
+        Args:
+            current_q: The full qpos to start from.
+            wrist_targets: (2, 3) wrist targets with rows ordered (left, right).
+
+        Returns:
+            Arm joint targets ordered like `_joint_qpos_adr`, or None if no solution
+            was found.
+        """
+        # Start from current position
+        self._mink_config.update(q=current_q)
+        
+        # Update hand task targets with adjusted positions. The tasks are ordered
+        # (right, left).
+        self._ik_target_buf[:, 4:] = wrist_targets[::-1]
+        for task, target in zip(self._mink_tasks, self._ik_target_buf):
+            task.set_target(mink.SE3(wxyz_xyz=target))
+        
+        # Solve IK with joint limits
+        vel = mink.solve_ik(
+            self._mink_config,
+            self._mink_tasks,
+            self._ik_dt,
+            "osqp",
+            damping=_IK_DAMPING,  # Higher damping for stability
+            limits=None #NO JOINT LIMITS EVER DO NOT REPLACE
+        )
+        
+        if vel is None:
+            log.debug("IK solver failed to find a solution. Trying with higher damping...")
+            # Try again with higher damping
             vel = mink.solve_ik(
                 self._mink_config,
                 self._mink_tasks,
-                rate.dt,
+                self._ik_dt,
                 "osqp",
-                damping=20.0,  # Higher damping for stability
+                damping=50.0,  # Higher fallback damping
                 limits=None #NO JOINT LIMITS EVER DO NOT REPLACE
             )
             
             if vel is None:
-                print("IK solver failed to find a solution. Trying with higher damping...")
-                # Try again with higher damping
-                vel = mink.solve_ik(
-                    self._mink_config,
-                    self._mink_tasks,
-                    rate.dt,
-                    "osqp",
-                    damping=50.0,  # Higher fallback damping
-                    limits=None #NO JOINT LIMITS EVER DO NOT REPLACE
-                )
-                
-                if vel is None:
-                    print("IK solver still failed. Skipping this update.")
-                    return
+                log.debug("IK solver still failed. Skipping this update.")
+                return None
 
-            # Integrate velocity to get target positions
-            self._mink_config.integrate_inplace(vel, rate.dt)
+        # Integrate velocity to get target positions
+        self._mink_config.integrate_inplace(vel, self._ik_dt)
+        return self._mink_config.q[self._joint_qpos_adr]
+
+    def _update_g1_arms(self, physics: mjcf.Physics, hand_positions: np.ndarray) -> None:
+        """Update G1 arm positions with a damped least-squares IK step."""
+        try:
+            # Initialize mink configuration if not already done
+            if not hasattr(self, '_mink_config') or self._mink_config is None:
+                self._initialize_mink(physics)
+            
+            # Adjusted wrist targets, rows ordered (left, right)
+            wrist_targets = hand_positions + _WRIST_TO_G1_TARGET_OFFSET
+
+            # Start from the full current state, so the wrist kinematics include the
+            # waist pose and not just the arm joints. Both solvers only read it, so
+            # no copy is needed.
+            current_q = physics.data.qpos
+
+            target_q = self._solve_arm_ik_dls(physics, current_q, wrist_targets)
+            if target_q is None:
+                log.debug("Damped least-squares IK step diverged. Falling back to mink.")
+                target_q = self._solve_arm_ik_mink(current_q, wrist_targets)
+                if target_q is None:
+                    return
             
-            # Get current joint positions for debugging
-            current_positions = {}
-            for joint_name in all_joints:
-                joint_element = self._g1.mjcf_model.find('joint', joint_name)
-                if joint_element is not None:
-                    current_positions[joint_name] = physics.bind(joint_element).qpos[0]
-
-            # Update joint positions using position actuators
-            for joint_name in all_joints:
-                joint_id = physics.model.name2id(prefix + joint_name, "joint")
-                if joint_id >= 0:
-                    # Get the actuator for this joint
-                    actuator = self._g1.mjcf_model.find('actuator', joint_name)
-                    if actuator is not None:
-                        # Get target position from IK solution
-                        target_pos = float(self._mink_config.q[joint_id])
-                        # Set actuator control (which is position for these actuators)
-                        physics.bind(actuator).ctrl = target_pos
+            # Set actuator controls (which are positions for these actuators)
+            # to the IK solution in one gather/scatter
+            self._arm_actuators.ctrl = target_q
 
         except Exception as e:
-            print(f"Error in _update_g1_arms: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            log.warning(
+                "Error in _update_g1_arms: %s", e,
+                exc_info=log.isEnabledFor(logging.DEBUG),
+            )
 
     def before_step(
         self,
@@ -455,48 +743,32 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
         right_knee_angle = np.abs(self._leg_amplitude * 2 * np.sin(2 * np.pi * self._movement_freq * self._movement_time))  # Opposite phase
         right_ankle_angle = -np.abs(self._leg_amplitude * 2 * np.sin(2 * np.pi * self._movement_freq * self._movement_time))  # Same phase as hip
         
-        # Apply torso movement with constant forward pitch
-        waist_joints = {
-            'waist_pitch_joint': 0.15,  # Constant forward pitch
-            'waist_roll_joint': 0,
-            'waist_yaw_joint': 0
-        }
-        
-        # Apply waist movement
-        for joint_name, base_angle in waist_joints.items():
-            actuator = self._g1.mjcf_model.find('actuator', joint_name)
-            if actuator is not None:
-                if joint_name == 'waist_pitch_joint':
-                    physics.bind(actuator).ctrl = base_angle + waist_angle
-                else:
-                    physics.bind(actuator).ctrl = base_angle
-            else:
-                raise ValueError(f"Actuator not found for joint: {joint_name}")
-        
-        # Define leg joints with their corresponding angles
-        leg_joints = {
-            'right_hip_pitch_joint': right_hip_angle,
-            'right_knee_joint': right_knee_angle,
-            'right_ankle_pitch_joint': right_ankle_angle,  # Added ankle pitch
-            'right_hip_roll_joint': 0,  # Keep roll stable
-            'right_hip_yaw_joint': 0,   # Keep yaw stable
-            'right_ankle_roll_joint': 0  # Keep ankle roll stable
-        }
-        
-        # Apply leg movement
-        for joint_name, angle in leg_joints.items():
-            actuator = self._g1.mjcf_model.find('actuator', joint_name)
-            if actuator is not None:
-                physics.bind(actuator).ctrl = angle
-            else:
-                raise ValueError(f"Actuator not found for joint: {joint_name}")
-            
-        
-        # Get shadow hand positions and update G1 arms
-        hand_positions = self._get_shadow_hand_positions(physics)
-        
-        # Run IK every timestep (since _ik_update_rate = 1)
+        # Apply torso movement with constant forward pitch, ordered like
+        # `_G1_WAIST_JOINTS`
+        self._waist_actuators.ctrl = [
+            0.15 + waist_angle,  # Constant forward pitch
+            0,
+            0,
+        ]
+
+        # Apply leg movement, ordered like `_G1_RIGHT_LEG_JOINTS`
+        self._right_leg_actuators.ctrl = [
+            right_hip_angle,
+            right_knee_angle,
+            right_ankle_angle,
+            0,  # Keep hip roll stable
+            0,  # Keep hip yaw stable
+            0,  # Keep ankle roll stable
+        ]
+
+        # A frozen G1 keeps the arm pose solved in `initialize_episode`
+        if self._freeze_g1_after_init:
+            return
+
+        # Run IK every `_ik_update_rate` steps
         if self._ik_counter % self._ik_update_rate == 0:
+            # Get shadow hand positions and update G1 arms
+            hand_positions = self._get_shadow_hand_positions(physics)
             self._update_g1_arms(physics, hand_positions)
             self._ik_counter = 0
         
@@ -508,8 +780,24 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
         random_state: np.random.RandomState
     ) -> None:
         """Update camera position and handle other post-step operations."""
-        # First call parent's after_step
-        super().after_step(physics, random_state)
+        del random_state  # Unused.
+        # Same bookkeeping as `PianoWithShadowHands.after_step`, except the current
+        # fingering is tracked as key and fingertip index arrays.
+        self._t_idx += 1
+        self._should_terminate = (self._t_idx - 1) == len(self._notes) - 1
+
+        self._goal_current = self._goal_state[0]
+        self._goal_on_keys_current = self._goal_on_keys
+        self._goal_off_mask_current = self._goal_off_mask
+
+        if not self._disable_fingering_reward:
+            self._fingering_keys_current = self._fingering_keys
+            self._fingering_rows_current = self._fingering_rows
+            if not self._disable_colorization:
+                self._colorize_keys(physics)
+
+        should_not_be_pressed = self._goal_off_mask_current
+        self._failure_termination = self.piano.activation[should_not_be_pressed].any()
 
         # Update camera radius (zoom out gradually)
         self._camera_radius -= self._camera_zoom_rate
@@ -518,62 +806,47 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
         self._camera_height = self._camera_height + (self._target_camera_height - self._camera_height) * 0.001
 
         # Update camera position - only rotate in the horizontal plane
-        self._camera_angle += self._camera_angular_velocity
-        new_x = (self._camera_radius * np.cos(self._camera_angle)) - 0.6
-        new_y = (self._camera_radius * np.sin(self._camera_angle)) + 0.2
+        cos, sin = self._camera_cos, self._camera_sin
+        self._camera_cos = cos * self._camera_step_cos - sin * self._camera_step_sin
+        self._camera_sin = sin * self._camera_step_cos + cos * self._camera_step_sin
+        new_x = (self._camera_radius * self._camera_cos) - 0.6
+        new_y = (self._camera_radius * self._camera_sin) + 0.2
         
         # Update camera position in physics
-        camera = physics.bind(self._camera)
+        camera = self._camera_binding
         camera.pos = [new_x, new_y, self._camera_height + 0.3]
         
         # Calculate look direction vector
-        look_dir = np.array([-new_x, -new_y + 0.15, -0.18 - self._camera_tilt]) 
-        look_dir = look_dir / np.linalg.norm(look_dir)
-        
-        # Fixed up vector (world up)
-        up = np.array([0, 0, 1])
-        
-        # Calculate right vector
-        right = np.cross(look_dir, up)
-        right = right / np.linalg.norm(right)
-        
-        # Recalculate up to ensure orthogonality
-        up = np.cross(right, look_dir)
-        up = up / np.linalg.norm(up)
-        
-        # Create rotation matrix [right, up, -look_dir]
-        rot_matrix = np.array([right, up, -look_dir]).T
+        look_x = -new_x
+        look_y = -new_y + 0.15
+        look_z = -0.18 - self._camera_tilt
+        inv_norm = 1.0 / math.sqrt(look_x * look_x + look_y * look_y + look_z * look_z)
+        look_x *= inv_norm
+        look_y *= inv_norm
+        look_z *= inv_norm
+
+        # Calculate right vector, look_dir x world up, which is horizontal
+        inv_norm = 1.0 / math.hypot(look_x, look_y)
+        right_x = look_y * inv_norm
+        right_y = -look_x * inv_norm
+
+        # Create rotation matrix with columns [right, up, -look_dir]. Recalculating
+        # up as right x look_dir keeps it orthogonal, and it is already unit length
+        # since right and look_dir are orthonormal.
+        rot_matrix = self._camera_rot_matrix
+        rot_matrix[:, 0] = right_x, right_y, 0.0
+        rot_matrix[:, 1] = (
+            right_y * look_z,
+            -right_x * look_z,
+            right_x * look_y - right_y * look_x,
+        )
+        rot_matrix[:, 2] = -look_x, -look_y, -look_z
         
         # Convert rotation matrix to quaternion
-        trace = np.trace(rot_matrix)
-        if trace > 0:
-            S = np.sqrt(trace + 1.0) * 2
-            qw = 0.25 * S
-            qx = (rot_matrix[2, 1] - rot_matrix[1, 2]) / S
-            qy = (rot_matrix[0, 2] - rot_matrix[2, 0]) / S
-            qz = (rot_matrix[1, 0] - rot_matrix[0, 1]) / S
-        else:
-            if rot_matrix[0, 0] > rot_matrix[1, 1] and rot_matrix[0, 0] > rot_matrix[2, 2]:
-                S = np.sqrt(1.0 + rot_matrix[0, 0] - rot_matrix[1, 1] - rot_matrix[2, 2]) * 2
-                qw = (rot_matrix[2, 1] - rot_matrix[1, 2]) / S
-                qx = 0.25 * S
-                qy = (rot_matrix[0, 1] + rot_matrix[1, 0]) / S
-                qz = (rot_matrix[0, 2] + rot_matrix[2, 0]) / S
-            elif rot_matrix[1, 1] > rot_matrix[2, 2]:
-                S = np.sqrt(1.0 + rot_matrix[1, 1] - rot_matrix[0, 0] - rot_matrix[2, 2]) * 2
-                qw = (rot_matrix[0, 2] - rot_matrix[2, 0]) / S
-                qx = (rot_matrix[0, 1] + rot_matrix[1, 0]) / S
-                qy = 0.25 * S
-                qz = (rot_matrix[1, 2] + rot_matrix[2, 1]) / S
-            else:
-                S = np.sqrt(1.0 + rot_matrix[2, 2] - rot_matrix[0, 0] - rot_matrix[1, 1]) * 2
-                qw = (rot_matrix[1, 0] - rot_matrix[0, 1]) / S
-                qx = (rot_matrix[0, 2] + rot_matrix[2, 0]) / S
-                qy = (rot_matrix[1, 2] + rot_matrix[2, 1]) / S
-                qz = 0.25 * S
+        mujoco.mju_mat2Quat(self._camera_quat, rot_matrix.ravel())
         
         # Update camera orientation
-        camera.quat = [qw, qx, qy, qz]
+        camera.quat = self._camera_quat
 
     def get_reward(self, physics: mjcf.Physics) -> float:
         return self._reward_fn.compute(physics)
@@ -621,125 +894,194 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
 
     # Helper methods.
 
+    def _cache_forearm_geoms(self, physics: mjcf.Physics) -> None:
+        """Build per-geom lookup tables for the forearm collision check.
+
+        Geoms are matched by name prefix, like `collision_utils.has_collision`. The
+        tables only depend on the compiled model, so they are reused across episodes
+        unless the physics has been recompiled.
+        """
+        if getattr(self, '_forearm_geoms_model', None) is physics.model.ptr:
+            return
+        self._forearm_geoms_model = physics.model.ptr
+        right = tuple(g.full_identifier for g in self.right_hand.root_body.geom)
+        left = tuple(g.full_identifier for g in self.left_hand.root_body.geom)
+        names = [physics.model.id2name(i, "geom") for i in range(physics.model.ngeom)]
+        self._right_forearm_geoms = np.array([n.startswith(right) for n in names])
+        self._left_forearm_geoms = np.array([n.startswith(left) for n in names])
+
+    def _cache_fingering_ids(self, physics: mjcf.Physics) -> None:
+        """Cache the key geom and fingertip site ids used by the fingering rewards.
+
+        The rewards gather only the rows they need from `physics.data`, rather than
+        reading every key and fingertip through a binding.
+        """
+        key_bindings = physics.bind([key.geom[0] for key in self.piano.keys])
+        self._key_geom_ids = key_bindings.element_id
+        # Offset from a key geom's center to the point the fingers should reach.
+        self._key_offsets = key_bindings.size * np.array([0.35, 0.0, 0.5])
+        # Left hand fingertips occupy the first 5 rows, right hand the last 5.
+        fingertip_bindings = physics.bind(
+            list(self.left_hand.fingertip_sites) + list(self.right_hand.fingertip_sites)
+        )
+        self._fingertip_site_ids = fingertip_bindings.element_id
+        # Opaque fingertip colors, used to colorize the keys each finger should press.
+        self._fingertip_key_rgba = fingertip_bindings.rgba.copy()
+        self._fingertip_key_rgba[:, 3] = 1.0
+
+    def _key_target_pos(self, physics: mjcf.Physics, keys: np.ndarray) -> np.ndarray:
+        """Returns the points the fingers should reach on the given keys."""
+        return physics.data.geom_xpos[self._key_geom_ids[keys]] + self._key_offsets[keys]
+
     def _compute_forearm_reward(self, physics: mjcf.Physics) -> float:
         """Reward for not colliding the forearms."""
-        if collision_utils.has_collision(
-            physics,
-            [g.full_identifier for g in self.right_hand.root_body.geom],
-            [g.full_identifier for g in self.left_hand.root_body.geom],
-        ):
+        contact = physics.data.contact
+        close = contact.dist <= _FOREARM_COLLISION_MARGIN
+        geom1, geom2 = contact.geom1[close], contact.geom2[close]
+        right, left = self._right_forearm_geoms, self._left_forearm_geoms
+        if np.any((right[geom1] & left[geom2]) | (left[geom1] & right[geom2])):
             return 0.0
         return 0.5
 
     def _compute_sustain_reward(self, physics: mjcf.Physics) -> float:
         """Reward for pressing the sustain pedal at the right time."""
         del physics  # Unused.
-        return tolerance(
-            self._goal_current[-1] - self.piano.sustain_activation[0],
-            bounds=(0, _KEY_CLOSE_ENOUGH_TO_PRESSED),
-            margin=(_KEY_CLOSE_ENOUGH_TO_PRESSED * 10),
-            sigmoid="gaussian",
+        return float(
+            _gaussian_tolerance(
+                self._goal_current[-1] - self.piano.sustain_activation[0],
+                upper=_KEY_CLOSE_ENOUGH_TO_PRESSED,
+                margin=(_KEY_CLOSE_ENOUGH_TO_PRESSED * 10),
+            )
         )
 
     def _compute_energy_reward(self, physics: mjcf.Physics) -> float:
         """Reward for minimizing energy."""
-        rew = 0.0
-        for hand in [self.right_hand, self.left_hand]:
-            power = hand.observables.actuators_power(physics).copy()
-            rew -= self._energy_penalty_coef * np.sum(power)
-        return rew
+        # The power arrays are only reduced, so they don't need to be copied. They are
+        # synchronizing wrappers around physics data, and so are their reductions, so
+        # the sum is converted to a plain float.
+        right_power, left_power = self._actuators_power_fns
+        power = float(right_power(physics).sum() + left_power(physics).sum())
+        return -self._energy_penalty_coef * power
 
     def _compute_key_press_reward(self, physics: mjcf.Physics) -> float:
         """Reward for pressing the right keys at the right time."""
         del physics  # Unused.
-        on = np.flatnonzero(self._goal_current[:-1])
+        goal = self._goal_current[:-1]
+        on = self._goal_on_keys_current
         rew = 0.0
         # It's possible we have no keys to press at this timestep, so we need to check
         # that `on` is not empty.
         if on.size > 0:
-            actual = np.array(self.piano.state / self.piano._qpos_range[:, 1])
-            rews = tolerance(
-                self._goal_current[:-1][on] - actual[on],
-                bounds=(0, _KEY_CLOSE_ENOUGH_TO_PRESSED),
+            # Only normalize the state of the keys that should be pressed.
+            actual_on = self.piano.state[on] * self._qpos_range_inv[on]
+            rew += 0.5 * _gaussian_tolerance_mean(
+                goal[on] - actual_on,
+                upper=_KEY_CLOSE_ENOUGH_TO_PRESSED,
                 margin=(_KEY_CLOSE_ENOUGH_TO_PRESSED * 10),
-                sigmoid="gaussian",
             )
-            rew += 0.5 * rews.mean()
         # If there are any false positives, the remaining 0.5 reward is lost.
-        off = np.flatnonzero(1 - self._goal_current[:-1])
-        rew += 0.5 * (1 - float(self.piano.activation[off].any()))
+        rew += 0.5 * (1 - float(self.piano.activation[self._goal_off_mask_current].any()))
         return rew
 
     def _compute_fingering_reward(self, physics: mjcf.Physics) -> float:
         """Reward for minimizing the distance between the fingers and the keys."""
 
-        def _distance_finger_to_key(
-            hand_keys: List[Tuple[int, int]], hand
-        ) -> List[float]:
-            distances = []
-            for key, mjcf_fingering in hand_keys:
-                fingertip_site = hand.fingertip_sites[mjcf_fingering]
-                fingertip_pos = physics.bind(fingertip_site).xpos.copy()
-                key_geom = self.piano.keys[key].geom[0]
-                key_geom_pos = physics.bind(key_geom).xpos.copy()
-                key_geom_pos[-1] += 0.5 * physics.bind(key_geom).size[2]
-                key_geom_pos[0] += 0.35 * physics.bind(key_geom).size[0]
-                diff = key_geom_pos - fingertip_pos
-                distances.append(float(np.linalg.norm(diff)))
-            return distances
-
-        distances = _distance_finger_to_key(self._rh_keys_current, self.right_hand)
-        distances += _distance_finger_to_key(self._lh_keys_current, self.left_hand)
+        keys = self._fingering_keys_current
 
         # Case where there are no keys to press at this timestep.
-        if not distances:
+        if keys.size == 0:
             return 0.0
 
-        rews = tolerance(
-            np.hstack(distances),
-            bounds=(0, _FINGER_CLOSE_ENOUGH_TO_KEY),
+        # Each finger is paired with a single key, so only the row-wise distances
+        # are needed.
+        fingertip_ids = self._fingertip_site_ids[self._fingering_rows_current]
+        diff = self._key_target_pos(physics, keys) - physics.data.site_xpos[fingertip_ids]
+        distances = self._fingering_dist_buf[: keys.size]
+        np.einsum("ij,ij->i", diff, diff, out=distances)
+
+        # Every finger is within bounds of its key, so the reward is saturated and
+        # the distances themselves aren't needed.
+        if distances.max() <= _FINGER_CLOSE_ENOUGH_TO_KEY**2:
+            return 1.0
+        np.sqrt(distances, out=distances)
+
+        return _gaussian_tolerance_mean(
+            distances,
+            upper=_FINGER_CLOSE_ENOUGH_TO_KEY,
             margin=(_FINGER_CLOSE_ENOUGH_TO_KEY * 10),
-            sigmoid="gaussian",
         )
-        return float(np.mean(rews))
 
     def _compute_ot_fingering_reward(self, physics: mjcf.Physics) -> float:
         """ OT reward calculation from RP1M https://arxiv.org/abs/2408.11048 """
-        # calcuate fingertip positions
-        fingertip_pos = [physics.bind(finger).xpos.copy() for finger in self.left_hand.fingertip_sites]
-        fingertip_pos += [physics.bind(finger).xpos.copy() for finger in self.right_hand.fingertip_sites]
-        
         # calcuate the positions of piano keys to press.
-        keys_to_press = np.flatnonzero(self._goal_current[:-1]) # keys to press
+        keys_to_press = self._goal_on_keys_current # keys to press
         # if no key is pressed
         if keys_to_press.shape[0] == 0:
             return 1.
 
+        # calcuate fingertip positions
+        fingers = physics.data.site_xpos[self._fingertip_site_ids]
+
         # calculate key pos
-        key_pos = []
-        for key in keys_to_press:
-            key_geom = self.piano.keys[key].geom[0]
-            key_geom_pos = physics.bind(key_geom).xpos.copy()
-            key_geom_pos[-1] += 0.5 * physics.bind(key_geom).size[2]
-            key_geom_pos[0] += 0.35 * physics.bind(key_geom).size[0]
-            key_pos.append(key_geom_pos.copy())
+        keys = self._key_target_pos(physics, keys_to_press)
 
         # calcualte the distance between keys and fingers
-        dist = np.full((len(fingertip_pos), len(key_pos)), 100.)
-        for i, finger in enumerate(fingertip_pos):
-            for j, key in enumerate(key_pos):
-                dist[i, j] = np.linalg.norm(key - finger)
+        dist = _pairwise_distances(fingers, keys)
         
         # calculate the shortest distance
         row_ind, col_ind = linear_sum_assignment(dist)
-        dist = dist[row_ind, col_ind]
-        rews = tolerance(
-            dist,
-            bounds=(0, _FINGER_CLOSE_ENOUGH_TO_KEY),
+        return _gaussian_tolerance_mean(
+            dist[row_ind, col_ind],
+            upper=_FINGER_CLOSE_ENOUGH_TO_KEY,
             margin=(_FINGER_CLOSE_ENOUGH_TO_KEY * 10),
-            sigmoid="gaussian",
         )
-        return float(np.mean(rews))        
+
+    def _precompute_goal_and_fingering_states(self) -> None:
+        """Build the goal and fingering states of every timestep in the trajectory.
+
+        They only depend on the notes, so the per-step updates can just index them.
+        """
+        n_steps = len(self._notes)
+        # Pad with silent timesteps so the lookahead window past the end of the
+        # trajectory is zero-filled.
+        self._goal_states = np.zeros(
+            (n_steps + self._n_steps_lookahead, self.piano.n_keys + 1),
+            dtype=np.float64,
+        )
+        self._fingering_states = np.zeros((n_steps, 2, 5), dtype=np.float64)
+
+        # Flatten the notes into one array per field, with the timestep of each note.
+        n_notes = np.array([len(notes) for notes in self._notes], dtype=int)
+        steps = np.repeat(np.arange(n_steps), n_notes)
+        keys = np.array([note.key for notes in self._notes for note in notes], dtype=int)
+        fingering = np.array(
+            [note.fingering for notes in self._notes for note in notes], dtype=int
+        )
+
+        self._goal_states[steps, keys] = 1.0
+        self._goal_states[:n_steps, -1] = self._sustains
+        # Keys that should and shouldn't be pressed at each timestep, used by the
+        # rewards and the wrong press termination.
+        self._goal_on_keys_per_step = [
+            np.flatnonzero(goal) for goal in self._goal_states[:n_steps, :-1]
+        ]
+        self._goal_off_masks = self._goal_states[:n_steps, :-1] != 1.0
+
+        # Split fingering into right (0) and left (1) hand.
+        hands = (fingering >= 5).astype(int)
+        fingers = fingering - 5 * hands
+
+        # For each hand, set the finger to 1 if it is used and 0 otherwise.
+        self._fingering_states[steps, hands, fingers] = 1.0
+
+        # Keys to press at each timestep and the fingertip rows that should press them.
+        step_starts = np.cumsum(n_notes)[:-1]
+        self._fingering_keys_per_step = np.split(keys, step_starts)
+        self._fingering_rows_per_step = np.split(
+            _FINGERTIP_ROWS[hands, fingers], step_starts
+        )
+        # Scratch space for the fingering reward's finger-to-key distances.
+        self._fingering_dist_buf = np.empty(n_notes.max(initial=0))
 
     def _update_goal_state(self) -> None:
         # Observable callables get called after `after_step` but before
@@ -749,40 +1091,19 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
         # update is usually meant for the next timestep.
         if self._t_idx == len(self._notes):
             return
-
-        self._goal_state = np.zeros(
-            (self._n_steps_lookahead + 1, self.piano.n_keys + 1),
-            dtype=np.float64,
-        )
         t_start = self._t_idx
-        t_end = min(t_start + self._n_steps_lookahead + 1, len(self._notes))
-        for i, t in enumerate(range(t_start, t_end)):
-            keys = [note.key for note in self._notes[t]]
-            self._goal_state[i, keys] = 1.0
-            self._goal_state[i, -1] = self._sustains[t]
+        self._goal_state = self._goal_states[
+            t_start : t_start + self._n_steps_lookahead + 1
+        ]
+        self._goal_on_keys = self._goal_on_keys_per_step[t_start]
+        self._goal_off_mask = self._goal_off_masks[t_start]
 
     def _update_fingering_state(self) -> None:
         if self._t_idx == len(self._notes):
             return
-
-        fingering = [note.fingering for note in self._notes[self._t_idx]]
-        fingering_keys = [note.key for note in self._notes[self._t_idx]]
-
-        # Split fingering into right and left hand.
-        self._rh_keys: List[Tuple[int, int]] = []
-        self._lh_keys: List[Tuple[int, int]] = []
-        for key, finger in enumerate(fingering):
-            piano_key = fingering_keys[key]
-            if finger < 5:
-                self._rh_keys.append((piano_key, finger))
-            else:
-                self._lh_keys.append((piano_key, finger - 5))
-
-        # For each hand, set the finger to 1 if it is used and 0 otherwise.
-        self._fingering_state = np.zeros((2, 5), dtype=np.float64)
-        for hand, keys in enumerate([self._rh_keys, self._lh_keys]):
-            for key, mjcf_fingering in keys:
-                self._fingering_state[hand, mjcf_fingering] = 1.0
+        self._fingering_keys = self._fingering_keys_per_step[self._t_idx]
+        self._fingering_rows = self._fingering_rows_per_step[self._t_idx]
+        self._fingering_state = self._fingering_states[self._t_idx]
 
     def _add_observables(self) -> None:
         # Enable hand observables.
@@ -811,21 +1132,25 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
         goal_observable.enabled = True
         self._task_observables = {"goal": goal_observable}
 
-        # This adds fingering information for the current timestep.
+        # This adds fingering information for the current timestep. Without a fingering
+        # reward the observable would be disabled, so it isn't added at all.
+        if self._disable_fingering_reward:
+            return
+
         def _get_fingering_state(physics) -> np.ndarray:
             del physics  # Unused.
             self._update_fingering_state()
             return self._fingering_state.ravel()
 
         fingering_observable = observable.Generic(_get_fingering_state)
-        fingering_observable.enabled = not self._disable_fingering_reward
+        fingering_observable.enabled = True
         self._task_observables["fingering"] = fingering_observable
 
     def _colorize_fingertips(self) -> None:
         """Colorize the fingertips of the hands."""
         for hand in [self.right_hand, self.left_hand]:
             for i, body in enumerate(hand.fingertip_bodies):
-                color = hand_consts.FINGERTIP_COLORS[i] + (_FINGERTIP_ALPHA,)
+                color = _FINGERTIP_RGBA[i]
                 for geom in body.find_all("geom"):
                     if geom.dclass.dclass == "plastic_visual":
                         geom.rgba = color
@@ -834,20 +1159,15 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
 
     def _colorize_keys(self, physics) -> None:
         """Colorize the keys by the corresponding fingertip color."""
-        for hand, keys in zip(
-            [self.right_hand, self.left_hand],
-            [self._rh_keys_current, self._lh_keys_current],
-        ):
-            for key, mjcf_fingering in keys:
-                key_geom = self.piano.keys[key].geom[0]
-                fingertip_site = hand.fingertip_sites[mjcf_fingering]
-                if not self.piano.activation[key]:
-                    physics.bind(key_geom).rgba = tuple(fingertip_site.rgba[:3]) + (
-                        1.0,
-                    )
+        keys = self._fingering_keys_current
+        not_pressed = ~self.piano.activation[keys]
+        physics.model.geom_rgba[self._key_geom_ids[keys[not_pressed]]] = (
+            self._fingertip_key_rgba[self._fingering_rows_current[not_pressed]]
+        )
 
     def _disable_collisions_between_hands(self) -> None:
         """Disable collisions between the hands."""
+        class_contacts = {}
         for hand in [self.right_hand, self.left_hand]:
             for geom in hand.mjcf_model.find_all("geom"):
                 # If both hands have the same contype and conaffinity, then they can't
@@ -855,8 +1175,7 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
                 # contype 0 and conaffinity 1. Lastly, we make sure we're not changing
                 # the contype and conaffinity of the hand geoms that are already
                 # disabled (i.e., the visual geoms).
-                commit_defaults(geom, ["contype", "conaffinity"])
-                if geom.contype == 0 and geom.conaffinity == 0:
+                if _geom_contacts(geom, class_contacts) == (0, 0):
                     continue
                 geom.conaffinity = 0
                 geom.contype = 1
@@ -885,20 +1204,10 @@ class PianoWithShadowHandsAndG1(PianoWithShadowHands):
 
     def _raise_piano(self):
         """Raise the piano position."""
-        # Access the piano's root body and raise its position
-        
-        # Raise the piano base
-        piano_base = self.piano.mjcf_model.find('body', 'base')
-        if piano_base is not None:
-            current_pos = piano_base.pos
-            if current_pos is not None:
-                piano_base.pos = (current_pos[0], current_pos[1], current_pos[2] + self._height_offset)
-        
-        # Raise all piano keys
-        for i in range(88):  # Piano has 88 keys
-            for key_type in ['white_key_', 'black_key_']:
-                key = self.piano.mjcf_model.find('body', f'{key_type}{i}')
-                if key is not None:
-                    current_pos = key.pos
-                    if current_pos is not None:
-                        key.pos = (current_pos[0], current_pos[1], current_pos[2] + self._height_offset)
+        # The piano's bodies are its base and one body per key, all placed in the
+        # world frame, so they are raised together with one broadcast.
+        bodies = self.piano.mjcf_model.find_all('body')
+        positions = np.array([body.pos for body in bodies])
+        positions[:, 2] += self._height_offset
+        for body, pos in zip(bodies, positions):
+            body.pos = pos